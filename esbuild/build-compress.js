@@ -0,0 +1,44 @@
+const path = require("path");
+const fs = require("fs");
+const zlib = require("zlib");
+const { promisify } = require("util");
+
+const brotli_compress = promisify(zlib.brotliCompress);
+const gzip = promisify(zlib.gzip);
+
+// precompressed copies can be served as-is by the web server (eg. nginx `gzip_static` / `brotli_static`)
+const COMPRESSIBLE_EXTENSIONS = [".js", ".css"];
+
+module.exports = {
+	name: "build_compress",
+	setup(build) {
+		build.onEnd((result) => {
+			if (result.errors.length) return;
+			return Promise.all(
+				Object.keys(result.metafile.outputs)
+					.filter((file) => COMPRESSIBLE_EXTENSIONS.includes(path.extname(file)))
+					.map(compress_file)
+			);
+		});
+	},
+};
+
+async function compress_file(file) {
+	const data = await fs.promises.readFile(file);
+
+	const [brotli_data, gzip_data] = await Promise.all([
+		brotli_compress(data, {
+			params: {
+				[zlib.constants.BROTLI_PARAM_MODE]: zlib.constants.BROTLI_MODE_TEXT,
+				[zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+				[zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+			},
+		}),
+		gzip(data, { level: zlib.constants.Z_BEST_COMPRESSION }),
+	]);
+
+	await Promise.all([
+		fs.promises.writeFile(`${file}.br`, brotli_data),
+		fs.promises.writeFile(`${file}.gz`, gzip_data),
+	]);
+}
@@ -13,6 +13,7 @@ const postCssPlugin = require("@frappe/esbuild-plugin-postcss2").default;
 const ignore_assets = require("./ignore-assets");
 const sass_options = require("./sass_options");
 const build_cleanup_plugin = require("./build-cleanup");
+const build_compress_plugin = require("./build-compress");
 
 const {
 	app_list,
@@ -276,6 +277,9 @@ function get_files_to_build(files) {
 
 function build_files({ files, outdir }) {
 	let build_plugins = [vue(), html_plugin, build_cleanup_plugin, vue_style_plugin];
+	if (PRODUCTION) {
+		build_plugins.push(build_compress_plugin);
+	}
 	return esbuild.build(get_build_options(files, outdir, build_plugins));
 }
 
@@ -294,6 +298,10 @@ function build_style_files({ files, outdir, rtl_style = false }) {
 		}),
 	];
 
+	if (PRODUCTION) {
+		build_plugins.push(build_compress_plugin);
+	}
+
 	plugins.push(require("autoprefixer"));
 	return esbuild.build(get_build_options(files, outdir, build_plugins));
 }
@@ -4,9 +4,12 @@ import os
 import re
 import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from itertools import chain
 from subprocess import getoutput
-from tempfile import mkdtemp
-from urllib.parse import urlparse
 
 import click
 from semantic_version import Version
@@ -18,38 +21,35 @@ app_paths = None
 sites_path = os.path.abspath(os.getcwd())
 WHITESPACE_PATTERN = re.compile(r"\s+")
 HTML_COMMENT_PATTERN = re.compile(r"(<!--.*?-->)")
-
-
-class AssetsNotDownloadedError(Exception):
-	pass
+# escapes for embedding text in a single-quoted JS string
+JS_STRING_ESCAPE_TABLE = str.maketrans({"\\": "\\\\", "'": "\\'"})
+ASSETS_CHUNK_SIZE = 256 * 1024
+# in order of preference, pigz uses separate threads for reading, writing and checksumming
+GZIP_DECOMPRESSORS = ("pigz", "gzip")
 
 
 class AssetsDontExistError(Exception):
 	pass
 
 
-def download_file(url, prefix):
-	from requests import get
+@lru_cache
+def get_assets_session():
+	"""Return a shared session, so that requests for assets reuse connections to the same host."""
+	import requests
 
-	filename = urlparse(url).path.split("/")[-1]
-	local_filename = os.path.join(prefix, filename)
-	with get(url, stream=True, allow_redirects=True) as r:
-		r.raise_for_status()
-		with open(local_filename, "wb") as f:
-			for chunk in r.iter_content(chunk_size=8192):
-				f.write(chunk)
-	return local_filename
+	# default adapters only pool connections, failed requests are neither retried nor raised for
+	return requests.Session()
 
 
 def build_missing_files():
 	"""Check which files dont exist yet from the assets.json and run build for those files"""
 
 	missing_assets = []
-	current_asset_files = []
+	current_asset_files = set()
 
 	for type in ["css", "js"]:
 		folder = os.path.join(sites_path, "assets", "frappe", "dist", type)
-		current_asset_files.extend(os.listdir(folder))
+		current_asset_files.update(os.listdir(folder))
 
 	development = frappe.local.conf.developer_mode or frappe.local.dev_server
 	build_mode = "development" if development else "production"
@@ -75,8 +75,6 @@ def build_missing_files():
 
 
 def get_assets_link(frappe_head) -> str:
-	import requests
-
 	tag = getoutput(
 		r"cd ../apps/frappe && git show-ref --tags -d | grep %s | sed -e 's,.*"
 		r" refs/tags/,,' -e 's/\^{}//'" % frappe_head
@@ -88,34 +86,100 @@ def get_assets_link(frappe_head) -> str:
 	else:
 		url = f"http://assets.frappeframework.com/{frappe_head}.tar.gz"
 
-	if not requests.head(url):
+	if not get_assets_session().head(url):
 		reference = f"Release {tag}" if tag else f"Commit {frappe_head}"
 		raise AssetsDontExistError(f"Assets for {reference} don't exist")
 
 	return url
 
 
-def fetch_assets(url, frappe_head):
+def fetch_assets(url):
+	"""Stream the assets archive from `url` and extract it on the fly, without writing it to disk."""
 	click.secho("Retrieving assets...", fg="yellow")
 
-	prefix = mkdtemp(prefix="frappe-assets-", suffix=frappe_head)
-	assets_archive = download_file(url, prefix)
-
-	if not assets_archive:
-		raise AssetsNotDownloadedError(f"Assets could not be retrived from {url}")
+	with get_assets_session().get(url, stream=True, allow_redirects=True) as r:
+		r.raise_for_status()
+		# undo any Content-Encoding the server applied, so gunzip() gets the .tar.gz bytes as stored
+		r.raw.decode_content = True
+		with gunzip(r.raw) as assets_archive:
+			directories_created = setup_assets(assets_archive)
 
 	click.echo(click.style("✔", fg="green") + f" Downloaded Frappe assets from {url}")
 
-	return assets_archive
+	return directories_created
+
+
+@contextmanager
+def gunzip(fileobj):
+	"""Yield a stream of the decompressed contents of the gzipped file object `fileobj`.
+
+	If available, an external `pigz` or `gzip` process does the decompression so that it runs
+	alongside the download instead of competing with it in this process.
+	"""
+	executable = next(filter(None, map(shutil.which, GZIP_DECOMPRESSORS)), None)
+
+	if not executable:
+		import gzip
+
+		with gzip.GzipFile(fileobj=fileobj, mode="rb") as f:
+			yield f
+		return
+
+	process = subprocess.Popen([executable, "-dc"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+	feed_errors = []
+
+	def feed():
+		try:
+			shutil.copyfileobj(fileobj, process.stdin, ASSETS_CHUNK_SIZE)
+		except BrokenPipeError:
+			# decompressor went away, its exit status is checked below
+			pass
+		except Exception as e:
+			# eg. connection reset while downloading, re-raised from the calling thread
+			feed_errors.append(e)
+		finally:
+			try:
+				process.stdin.close()
+			except BrokenPipeError:
+				pass
+
+	def wait():
+		process.stdout.close()
+		feeder.join()
+		process.wait()
+
+		# a failed read truncates the archive for the decompressor and tar as well,
+		# so it takes precedence over the errors they run into
+		if feed_errors:
+			raise feed_errors[0]
+
+	feeder = threading.Thread(target=feed, daemon=True)
+	feeder.start()
+
+	try:
+		yield process.stdout
+		# drain any trailing padding so the decompressor can exit cleanly
+		while process.stdout.read(ASSETS_CHUNK_SIZE):
+			pass
+	except BaseException:
+		process.kill()
+		wait()
+		raise
+
+	wait()
+
+	if process.returncode:
+		raise subprocess.CalledProcessError(process.returncode, process.args)
 
 
 def setup_assets(assets_archive):
+	"""Extract the (uncompressed) assets tarball read from the file object `assets_archive`."""
 	import tarfile
 
 	directories_created = set()
 
 	click.secho("\nExtracting assets...\n", fg="yellow")
-	with tarfile.open(assets_archive) as tar:
+	with tarfile.open(fileobj=assets_archive, mode="r|", bufsize=ASSETS_CHUNK_SIZE) as tar:
 		for file in tar:
 			if not file.isdir():
 				dest = "." + file.name.replace("./frappe-bench/sites", "")
@@ -144,8 +208,7 @@ def download_frappe_assets(verbose=True) -> bool:
 
 	try:
 		url = get_assets_link(frappe_head)
-		assets_archive = fetch_assets(url, frappe_head)
-		setup_assets(assets_archive)
+		fetch_assets(url)
 		build_missing_files()
 		return True
 
@@ -156,12 +219,6 @@ def download_frappe_assets(verbose=True) -> bool:
 		# TODO: log traceback in bench.log
 		click.secho(str(e), fg="red")
 
-	finally:
-		try:
-			shutil.rmtree(os.path.dirname(assets_archive))
-		except Exception:
-			pass
-
 	return False
 
 
@@ -177,28 +234,17 @@ def symlink(target, link_name, overwrite=False):
 	if not overwrite:
 		return os.symlink(target, link_name)
 
-	# Create link to target with temporary filename
-	while True:
-		temp_link_name = f"tmp{frappe.generate_hash()}"
-
-		# os.* functions mimic as closely as possible system functions
-		# The POSIX symlink() returns EEXIST if link_name already exists
-		# https://pubs.opengroup.org/onlinepubs/9699919799/functions/symlink.html
-		try:
-			os.symlink(target, temp_link_name)
-			break
-		except FileExistsError:
-			pass
+	# Create link to target with a random temporary name next to link_name,
+	# so that os.replace doesn't have to cross directories (or filesystems)
+	temp_link_name = os.path.join(os.path.dirname(link_name), f".tmp{frappe.generate_hash()}")
+	os.symlink(target, temp_link_name)
 
 	# Replace link_name with temp_link_name
 	try:
 		# Pre-empt os.replace on a directory with a nicer message
 		if os.path.isdir(link_name):
 			raise IsADirectoryError(f"Cannot symlink over existing directory: '{link_name}'")
-		try:
-			os.replace(temp_link_name, link_name)
-		except AttributeError:
-			os.renames(temp_link_name, link_name)
+		os.replace(temp_link_name, link_name)
 	except Exception:
 		if os.path.islink(temp_link_name):
 			os.remove(temp_link_name)
@@ -309,34 +355,28 @@ def generate_assets_map():
 	symlinks = {}
 
 	for app_name in frappe.get_all_apps():
-		app_doc_path = None
-
 		pymodule = frappe.get_module(app_name)
+		# already absolute and normalized, so paths derived from it don't need os.path.abspath
 		app_base_path = os.path.abspath(os.path.dirname(pymodule.__file__))
-		app_public_path = os.path.join(app_base_path, "public")
-		app_node_modules_path = os.path.join(app_base_path, "..", "node_modules")
+		app_assets = os.path.join(app_base_path, "public")
+		app_node_modules = os.path.join(os.path.dirname(app_base_path), "node_modules")
 		app_docs_path = os.path.join(app_base_path, "docs")
 		app_www_docs_path = os.path.join(app_base_path, "www", "docs")
-
-		app_assets = os.path.abspath(app_public_path)
-		app_node_modules = os.path.abspath(app_node_modules_path)
+		app_assets_path = os.path.join(assets_path, app_name)
 
 		# {app}/public > assets/{app}
 		if os.path.isdir(app_assets):
-			symlinks[app_assets] = os.path.join(assets_path, app_name)
+			symlinks[app_assets] = app_assets_path
 
 		# {app}/node_modules > assets/{app}/node_modules
 		if os.path.isdir(app_node_modules):
-			symlinks[app_node_modules] = os.path.join(assets_path, app_name, "node_modules")
+			symlinks[app_node_modules] = os.path.join(app_assets_path, "node_modules")
 
 		# {app}/docs > assets/{app}_docs
 		if os.path.isdir(app_docs_path):
-			app_doc_path = os.path.join(app_base_path, "docs")
+			symlinks[app_docs_path] = app_assets_path + "_docs"
 		elif os.path.isdir(app_www_docs_path):
-			app_doc_path = os.path.join(app_base_path, "www", "docs")
-		if app_doc_path:
-			app_docs = os.path.abspath(app_doc_path)
-			symlinks[app_docs] = os.path.join(assets_path, app_name + "_docs")
+			symlinks[app_www_docs_path] = app_assets_path + "_docs"
 
 	return symlinks
 
@@ -347,10 +387,10 @@ def setup_assets_dirs():
 
 
 def clear_broken_symlinks():
-	for path in os.listdir(assets_path):
-		path = os.path.join(assets_path, path)
-		if os.path.islink(path) and not os.path.exists(path):
-			os.remove(path)
+	with os.scandir(assets_path) as entries:
+		for entry in entries:
+			if entry.is_symlink() and not os.path.exists(entry.path):
+				os.remove(entry.path)
 
 
 def unstrip(message: str) -> str:
@@ -374,18 +414,33 @@ def make_asset_dirs(hard_link=False):
 	clear_broken_symlinks()
 	symlinks = generate_assets_map()
 
+	# links nested under another link (eg. assets/{app}/node_modules under assets/{app}) have to be
+	# made after it, so links of an app are made in order while separate apps are linked concurrently
+	app_symlinks = {}
 	for source, target in symlinks.items():
-		start_message = unstrip(f"{'Copying assets from' if hard_link else 'Linking'} {source} to {target}")
-		fail_message = unstrip(f"Cannot {'copy' if hard_link else 'link'} {source} to {target}")
+		app_target = os.path.relpath(target, assets_path).split(os.sep, 1)[0]
+		app_symlinks.setdefault(app_target, []).append((source, target))
+
+	with ThreadPoolExecutor() as executor:
+		failed = executor.map(partial(link_assets_dirs, hard_link=hard_link), app_symlinks.values())
+
+	# reported from here rather than the workers, so that lines from separate apps don't overwrite each other
+	for source, target in chain.from_iterable(failed):
+		click.echo(unstrip(f"Cannot {'copy' if hard_link else 'link'} {source} to {target}"))
+
+	click.echo(unstrip(click.style("✔", fg="green") + " Application Assets Linked") + "\n")
+
 
-		# Used '\r' instead of '\x1b[1K\r' to print entire lines in smaller terminal sizes
+def link_assets_dirs(symlinks, hard_link=False):
+	"""Link (or copy) each source to its target in order, returning the pairs that failed."""
+	failed = []
+	for source, target in symlinks:
 		try:
-			print(start_message, end="\r")
 			link_assets_dir(source, target, hard_link=hard_link)
 		except Exception:
-			print(fail_message, end="\r")
+			failed.append((source, target))
 
-	click.echo(unstrip(click.style("✔", fg="green") + " Application Assets Linked") + "\n")
+	return failed
 
 
 def link_assets_dir(source, target, hard_link=False):
@@ -399,24 +454,45 @@ def link_assets_dir(source, target, hard_link=False):
 			shutil.rmtree(target)
 
 	if hard_link:
-		shutil.copytree(source, target, dirs_exist_ok=True)
+		copy_assets_dir(source, target)
 	else:
 		symlink(source, target, overwrite=True)
 
 
+def copy_assets_dir(source, target):
+	"""Copy the directory tree `source` to `target`, cloning files where the filesystem supports it."""
+	if cp := get_reflink_cp():
+		# shares data blocks on copy-on-write filesystems (btrfs, XFS) instead of copying bytes
+		subprocess.run([cp, "-R", "-L", "-p", "--reflink=auto", source, target], check=True)
+	else:
+		shutil.copytree(source, target, dirs_exist_ok=True)
+
+
+@lru_cache
+def get_reflink_cp():
+	"""Return the path of `cp` if it accepts `--reflink=auto` (GNU coreutils), else None."""
+	cp = shutil.which("cp")
+	if not cp:
+		return
+
+	probe = subprocess.run(
+		[cp, "--reflink=auto", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+	)
+	if probe.returncode == 0:
+		return cp
+
+
 def scrub_html_template(content):
 	"""Return HTML content with removed whitespace and comments."""
 	# remove whitespace to a single space
 	content = WHITESPACE_PATTERN.sub(" ", content)
 
 	# strip comments
-	content = HTML_COMMENT_PATTERN.sub("", content)
-
-	return content.replace("'", "'")
+	return HTML_COMMENT_PATTERN.sub("", content)
 
 
 def html_to_js_template(path, content):
 	"""Return HTML template content as Javascript code, by adding it to `frappe.templates`."""
-	return """frappe.templates["{key}"] = '{content}';\n""".format(
-		key=path.rsplit("/", 1)[-1][:-5], content=scrub_html_template(content)
-	)
+	key = path.rsplit("/", 1)[-1][:-5]
+	content = scrub_html_template(content).translate(JS_STRING_ESCAPE_TABLE)
+	return f"""frappe.templates["{key}"] = '{content}';\n"""
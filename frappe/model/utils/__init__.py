@@ -73,7 +73,10 @@ def render_include(content):
 					if path.endswith(".html"):
 						include = html_to_js_template(path, include)
 
-					content = re.sub(rf"""{{% include\s['"]{path}['"]\s%}}""", include, content)
+					# substitute `include` verbatim, backslash escapes in it are meant for the JS parser
+					content = re.sub(
+						rf"""{{% include\s['"]{path}['"]\s%}}""", lambda _, include=include: include, content
+					)
 
 		else:
 			break
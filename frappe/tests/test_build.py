@@ -0,0 +1,74 @@
+import gzip
+import io
+import os
+import tarfile
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import frappe.build
+from frappe.build import gunzip, setup_assets
+
+
+class FailingReader(io.RawIOBase):
+	"""Readable stream whose connection is reset halfway through, like a dropped download."""
+
+	def __init__(self, data):
+		self.buffer = io.BytesIO(data)
+		self.fail_at = len(data) // 2
+
+	def readable(self):
+		return True
+
+	def read(self, size=-1):
+		remaining = self.fail_at - self.buffer.tell()
+		if remaining <= 0:
+			raise ConnectionResetError("Connection reset by peer")
+		return self.buffer.read(remaining if size < 0 else min(size, remaining))
+
+
+def make_assets_archive():
+	contents = os.urandom(4096)
+	tar_buffer = io.BytesIO()
+	with tarfile.open(fileobj=tar_buffer, mode="w") as tar:
+		info = tarfile.TarInfo("./frappe-bench/sites/assets/frappe/dist/js/test.bundle.js")
+		info.size = len(contents)
+		tar.addfile(info, io.BytesIO(contents))
+
+	return gzip.compress(tar_buffer.getvalue()), contents
+
+
+# external pigz/gzip process and the in-process fallback
+DECOMPRESSORS = (frappe.build.GZIP_DECOMPRESSORS, ())
+
+
+class TestSetupAssets(unittest.TestCase):
+	def setUp(self):
+		self.archive, self.contents = make_assets_archive()
+
+		# setup_assets extracts relative to the current directory (sites)
+		tmpdir = TemporaryDirectory()
+		self.addCleanup(tmpdir.cleanup)
+		self.addCleanup(os.chdir, os.getcwd())
+		os.chdir(tmpdir.name)
+
+	def test_extract_assets(self):
+		for decompressors in DECOMPRESSORS:
+			with self.subTest(decompressors=decompressors), patch.object(
+				frappe.build, "GZIP_DECOMPRESSORS", decompressors
+			):
+				with gunzip(io.BytesIO(self.archive)) as assets_archive:
+					setup_assets(assets_archive)
+
+				with open("assets/frappe/dist/js/test.bundle.js", "rb") as f:
+					self.assertEqual(f.read(), self.contents)
+
+	def test_failed_download_is_raised(self):
+		for decompressors in DECOMPRESSORS:
+			with self.subTest(decompressors=decompressors), patch.object(
+				frappe.build, "GZIP_DECOMPRESSORS", decompressors
+			):
+				# the download error, not the resulting truncated gzip/tar stream error
+				with self.assertRaises(ConnectionResetError):
+					with gunzip(FailingReader(self.archive)) as assets_archive:
+						setup_assets(assets_archive)
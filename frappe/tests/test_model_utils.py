@@ -1,9 +1,12 @@
+import os
 from contextlib import contextmanager
 from random import choice
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
 import frappe
 from frappe.model import core_doctypes_list, get_permitted_fields, is_default_field
-from frappe.model.utils import get_fetch_values
+from frappe.model.utils import get_fetch_values, render_include
 from frappe.tests.utils import FrappeTestCase
 
 
@@ -73,6 +76,21 @@ class TestModelUtils(FrappeTestCase):
 		self.assertFalse(is_default_field(True))
 		self.assertFalse(is_default_field(42))
 
+	def test_render_include_html_template(self):
+		with TemporaryDirectory() as tmpdir:
+			template_path = os.path.join(tmpdir, "quoted_template.html")
+			with open(template_path, "w", encoding="utf-8") as f:
+				f.write("<p class='note'>\n\tC:\\temp <!-- comment --></p>\n")
+
+			with patch("frappe.get_app_path", return_value=template_path):
+				rendered = render_include('{% include "frappe/quoted_template.html" %}')
+
+		# quotes and backslashes are escaped for the single-quoted JS string, and kept as-is by render_include
+		self.assertEqual(
+			rendered,
+			"""frappe.templates["quoted_template"] = '<p class=\\'note\\'> C:\\\\temp </p> ';\n""",
+		)
+
 
 @contextmanager
 def set_user(user: str):